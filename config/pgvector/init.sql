@@ -67,6 +67,7 @@ CREATE TABLE IF NOT EXISTS documents (
     doc_type VARCHAR(100) DEFAULT 'general',
     tags TEXT[] DEFAULT '{}',
     metadata JSONB DEFAULT '{}',
+    embeddings vector(1024), -- document-level mxbai-embed-large embedding
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(content_hash, project) -- Prevent duplicates per project
@@ -83,6 +84,13 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Embedding cache keyed by a BLAKE2b-256 hash of the embedded text
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    content_hash BYTEA PRIMARY KEY,
+    embedding vector(1024) NOT NULL, -- mxbai-embed-large dimension
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- ========================================
 -- CONFIGURATION TRACKING
 -- ========================================
@@ -152,6 +160,16 @@ CREATE INDEX IF NOT EXISTS idx_documents_project ON documents(project);
 CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(doc_type);
 CREATE INDEX IF NOT EXISTS idx_documents_tags ON documents USING GIN(tags);
 CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+-- Covers duplicate detection: GROUP BY content_hash ordered by created_at
+CREATE INDEX IF NOT EXISTS idx_documents_project_hash
+ON documents(project, content_hash, created_at, id) WHERE content_hash IS NOT NULL;
+-- Covers the automatic processing keyset scan for not-yet-processed documents, newest first
+CREATE INDEX IF NOT EXISTS idx_documents_unprocessed
+ON documents(created_at DESC NULLS LAST, id DESC)
+WHERE metadata->>'entities_extracted' IS NULL
+   OR metadata->>'relationships_created' IS NULL
+   OR metadata->>'embeddings_generated' = 'false';
+CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id ON document_chunks(document_id);
 
 -- Vector search index (HNSW for fast approximate nearest neighbor)
 CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding 
@@ -226,6 +244,69 @@ BEGIN
 END;
 $$;
 
+-- Duplicate cleanup: analysis, delete and post-state counts in one call,
+-- keeping the oldest copy per content_hash (used by cleanup_duplicates.py)
+CREATE OR REPLACE FUNCTION fk_dedup_documents(p_project text, p_dry_run boolean)
+RETURNS TABLE(phase text, metric text, value bigint)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_total_docs bigint;
+    v_total_chunks bigint;
+    v_sets bigint;
+    v_duplicate_docs bigint;
+    v_excess uuid[];
+    v_excess_chunks bigint;
+    v_deleted bigint := 0;
+BEGIN
+    SELECT COUNT(*) INTO v_total_docs
+    FROM documents WHERE project = p_project;
+
+    SELECT COUNT(*) INTO v_total_chunks
+    FROM document_chunks dc
+    JOIN documents d ON d.id = dc.document_id
+    WHERE d.project = p_project;
+
+    SELECT COUNT(*), COALESCE(SUM(n), 0) INTO v_sets, v_duplicate_docs
+    FROM (
+        SELECT COUNT(*) AS n FROM documents
+        WHERE project = p_project AND content_hash IS NOT NULL
+        GROUP BY content_hash
+        HAVING COUNT(*) > 1
+    ) g;
+
+    SELECT COALESCE(array_agg(id), '{}') INTO v_excess
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY content_hash ORDER BY created_at
+        ) AS rn
+        FROM documents
+        WHERE project = p_project AND content_hash IS NOT NULL
+    ) ranked
+    WHERE rn > 1;
+
+    SELECT COUNT(*) INTO v_excess_chunks
+    FROM document_chunks WHERE document_id = ANY(v_excess);
+
+    IF p_dry_run THEN
+        v_deleted := cardinality(v_excess);
+    ELSE
+        DELETE FROM documents WHERE id = ANY(v_excess);
+        GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    END IF;
+
+    RETURN QUERY VALUES
+        ('analysis', 'total_documents', v_total_docs),
+        ('analysis', 'duplicate_sets', v_sets),
+        ('analysis', 'total_duplicate_docs', v_duplicate_docs),
+        ('analysis', 'total_excess_docs', cardinality(v_excess)::bigint),
+        ('analysis', 'total_chunks_to_delete', v_excess_chunks),
+        ('cleanup', 'documents_deleted', v_deleted),
+        ('cleanup', 'chunks_deleted', v_excess_chunks),
+        ('cleanup', 'final_document_count', v_total_docs - v_deleted),
+        ('cleanup', 'final_chunk_count', v_total_chunks - v_excess_chunks);
+END;
+$$;
+
 -- ========================================
 -- SAMPLE DATA (Optional)
 -- ========================================
@@ -143,7 +143,7 @@ class IngestionService:
                 100,
                 "Processing complete",
                 progress_callback,
-                result.dict()
+                result.model_dump()
             )
             
             # Clean up temporary file
@@ -172,7 +172,7 @@ class IngestionService:
                 0,
                 f"Error: {str(e)}",
                 progress_callback,
-                result.dict()
+                result.model_dump()
             )
             
             return result
@@ -419,11 +419,11 @@ class IngestionService:
         )
         
         # Store in active tasks
-        self.active_tasks[ingestion_id] = progress_update.dict()
+        self.active_tasks[ingestion_id] = progress_update.model_dump()
         
         # Call callback if provided
         if callback:
-            await callback(progress_update.dict())
+            await callback(progress_update.model_dump())
 
     async def get_status(self, ingestion_id: str) -> Optional[Dict[str, Any]]:
         """Get current status of ingestion task"""
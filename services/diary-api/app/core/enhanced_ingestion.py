@@ -3,17 +3,63 @@ Enhanced document ingestion that uses the automatic processing pipeline
 """
 
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 from uuid import uuid4
 from datetime import datetime
 import json
 import asyncpg
 
 from app.core import processing_pipeline
+from app.services.chunking import chunk_text
 
 logger = logging.getLogger(__name__)
 
-async def process_document_with_pipeline(doc_data: Dict[str, Any], doc_id: str = None) -> str:
+EmbedBatch = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+async def store_document_chunks(conn, doc_id: str, content: str, embed: EmbedBatch) -> int:
+    """
+    Split a document into chunks, embed them in one batch and replace its stored chunks
+    
+    Returns the number of chunks stored
+    """
+    chunks = chunk_text(content)
+    if not chunks:
+        return 0
+    
+    embeddings = await embed([chunk["content"] for chunk in chunks])
+    if len(embeddings) != len(chunks):
+        logger.warning(f"Chunk embedding failed for document {doc_id}, storing chunks without vectors")
+        embeddings = [None] * len(chunks)
+    
+    rows = [
+        (
+            doc_id,
+            index,
+            chunk["content"],
+            str(embedding) if embedding else None,
+            json.dumps({
+                "start_char": chunk["start_char"],
+                "end_char": chunk["end_char"],
+                "token_count": chunk["token_count"]
+            })
+        )
+        for index, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+    ]
+    
+    async with conn.transaction():
+        await conn.execute("DELETE FROM document_chunks WHERE document_id = $1", doc_id)
+        await conn.executemany("""
+            INSERT INTO document_chunks (document_id, chunk_index, content, embedding, metadata)
+            VALUES ($1, $2, $3, $4::text::vector, $5::jsonb)
+        """, rows)
+    
+    return len(rows)
+
+async def process_document_with_pipeline(
+    doc_data: Dict[str, Any],
+    doc_id: str = None,
+    embed: Optional[EmbedBatch] = None
+) -> str:
     """
     Process document using the automatic processing pipeline
     This ensures ALL documents get:
@@ -21,6 +67,9 @@ async def process_document_with_pipeline(doc_data: Dict[str, Any], doc_id: str =
     - Full embeddings
     - Complete knowledge graph
     - Metadata tracking
+    
+    When embed is given, the content is also chunked and every chunk is
+    embedded with one batched call and stored in document_chunks.
     """
     try:
         if not doc_id:
@@ -52,6 +101,14 @@ async def process_document_with_pipeline(doc_data: Dict[str, Any], doc_id: str =
             
             logger.info(f"📝 Document {doc_id} stored in PostgreSQL")
             
+            # Chunk and embed for retrieval; a failure here must not block the pipeline
+            if embed is not None:
+                try:
+                    chunk_count = await store_document_chunks(conn, doc_id, doc_data['content'], embed)
+                    logger.info(f"🧩 Stored {chunk_count} chunks for document {doc_id}")
+                except Exception as e:
+                    logger.error(f"Failed to store chunks for document {doc_id}: {e}")
+            
             # Get the document record
             doc = await conn.fetchrow("""
                 SELECT id, title, content, project, doc_type, tags, metadata
@@ -0,0 +1,117 @@
+"""
+Schema migrations - bring existing databases up to the schema in init.sql
+
+init.sql only runs when the PostgreSQL volume is first created, so objects
+added to it later are applied here on API startup. Every statement is
+idempotent and safe to run on each start.
+"""
+
+import logging
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Analysis, delete and post-state counts in a single server-side call.
+# Chunks are removed by the ON DELETE CASCADE foreign key.
+DEDUP_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION fk_dedup_documents(p_project text, p_dry_run boolean)
+    RETURNS TABLE(phase text, metric text, value bigint)
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        v_total_docs bigint;
+        v_total_chunks bigint;
+        v_sets bigint;
+        v_duplicate_docs bigint;
+        v_excess uuid[];
+        v_excess_chunks bigint;
+        v_deleted bigint := 0;
+    BEGIN
+        SELECT COUNT(*) INTO v_total_docs
+        FROM documents WHERE project = p_project;
+
+        SELECT COUNT(*) INTO v_total_chunks
+        FROM document_chunks dc
+        JOIN documents d ON d.id = dc.document_id
+        WHERE d.project = p_project;
+
+        SELECT COUNT(*), COALESCE(SUM(n), 0) INTO v_sets, v_duplicate_docs
+        FROM (
+            SELECT COUNT(*) AS n FROM documents
+            WHERE project = p_project AND content_hash IS NOT NULL
+            GROUP BY content_hash
+            HAVING COUNT(*) > 1
+        ) g;
+
+        SELECT COALESCE(array_agg(id), '{}') INTO v_excess
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY content_hash ORDER BY created_at
+            ) AS rn
+            FROM documents
+            WHERE project = p_project AND content_hash IS NOT NULL
+        ) ranked
+        WHERE rn > 1;
+
+        SELECT COUNT(*) INTO v_excess_chunks
+        FROM document_chunks WHERE document_id = ANY(v_excess);
+
+        IF p_dry_run THEN
+            v_deleted := cardinality(v_excess);
+        ELSE
+            DELETE FROM documents WHERE id = ANY(v_excess);
+            GET DIAGNOSTICS v_deleted = ROW_COUNT;
+        END IF;
+
+        RETURN QUERY VALUES
+            ('analysis', 'total_documents', v_total_docs),
+            ('analysis', 'duplicate_sets', v_sets),
+            ('analysis', 'total_duplicate_docs', v_duplicate_docs),
+            ('analysis', 'total_excess_docs', cardinality(v_excess)::bigint),
+            ('analysis', 'total_chunks_to_delete', v_excess_chunks),
+            ('cleanup', 'documents_deleted', v_deleted),
+            ('cleanup', 'chunks_deleted', v_excess_chunks),
+            ('cleanup', 'final_document_count', v_total_docs - v_deleted),
+            ('cleanup', 'final_chunk_count', v_total_chunks - v_excess_chunks);
+    END;
+    $$;
+"""
+
+SCHEMA_MIGRATION_SQL = """
+    CREATE EXTENSION IF NOT EXISTS vector;
+
+    ALTER TABLE documents ADD COLUMN IF NOT EXISTS embeddings vector(1024);
+
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        content_hash BYTEA PRIMARY KEY,
+        embedding vector(1024) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_documents_project_hash
+    ON documents(project, content_hash, created_at, id) WHERE content_hash IS NOT NULL;
+
+    CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id ON document_chunks(document_id);
+
+    CREATE INDEX IF NOT EXISTS idx_documents_unprocessed
+    ON documents(created_at DESC NULLS LAST, id DESC)
+    WHERE metadata->>'entities_extracted' IS NULL
+       OR metadata->>'relationships_created' IS NULL
+       OR metadata->>'embeddings_generated' = 'false';
+"""
+
+# Advisory lock key so concurrently starting workers migrate one at a time
+MIGRATION_LOCK_KEY = 0x666b3273  # "fk2s"
+
+# Seconds allowed for the migration; first-time index builds on large tables
+# can outlast the pool's command timeout
+MIGRATION_TIMEOUT = 3600
+
+
+async def apply_schema_migrations(conn: asyncpg.Connection) -> None:
+    """Apply the idempotent schema migration in one transaction"""
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_KEY)
+        await conn.execute(SCHEMA_MIGRATION_SQL, timeout=MIGRATION_TIMEOUT)
+        await conn.execute(DEDUP_FUNCTION_SQL)
+    logger.info("✅ PostgreSQL schema is up to date")
@@ -0,0 +1,43 @@
+"""
+Text Chunking Service - split documents into overlapping, embeddable chunks
+"""
+
+import re
+from typing import Any, Dict, List
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def chunk_text(content: str, max_tokens: int = 512, overlap: int = 64) -> List[Dict[str, Any]]:
+    """
+    Split content into overlapping chunks of roughly max_tokens words
+
+    Word count approximates tokens; each chunk keeps its character offsets
+    into the original content, so content[start_char:end_char] is the chunk.
+
+    Args:
+        content: Text to split
+        max_tokens: Maximum words per chunk
+        overlap: Words shared by consecutive chunks
+
+    Returns:
+        Chunks with content, start_char, end_char and token_count
+    """
+    words = [(m.start(), m.end()) for m in _WORD_RE.finditer(content)]
+    if not words:
+        return []
+
+    chunks = []
+    step = max(max_tokens - overlap, 1)
+    for start in range(0, len(words), step):
+        window = words[start:start + max_tokens]
+        start_char, end_char = window[0][0], window[-1][1]
+        chunks.append({
+            "content": content[start_char:end_char],
+            "start_char": start_char,
+            "end_char": end_char,
+            "token_count": len(window)
+        })
+        if start + max_tokens >= len(words):
+            break
+    return chunks
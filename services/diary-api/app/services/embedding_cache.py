@@ -0,0 +1,101 @@
+"""
+Embedding Cache Service - exact-match Redis cache in front of Ollama embeddings
+
+Shared by the API and the automatic processing pipeline, so both read and
+write the same entries: keys are embed:{model}:{blake2b-256 of the text} and
+values are packed float32 vectors.
+"""
+
+import hashlib
+import logging
+import os
+from array import array
+from typing import Awaitable, Callable, List, Optional
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", str(7 * 24 * 3600)))  # 7 days
+REDIS_URL = os.getenv(
+    "REDIS_URL",
+    f"redis://{os.getenv('REDIS_HOST', 'fk2_redis')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+)
+
+# Separate from db_manager's client, which decodes responses to str
+_redis: Optional[aioredis.Redis] = None
+
+
+def _get_redis() -> aioredis.Redis:
+    """Lazily create the binary Redis client backing the cache"""
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(REDIS_URL, socket_connect_timeout=5, socket_timeout=5)
+    return _redis
+
+
+async def close():
+    """Close the cache's Redis client"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+def _cache_key(model: str, text: str) -> str:
+    """Redis key for a text embedded by a given model"""
+    return f"embed:{model}:{hashlib.blake2b(text.encode(), digest_size=32).hexdigest()}"
+
+
+async def get_or_embed(
+    texts: List[str],
+    embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+    model: str
+) -> List[List[float]]:
+    """
+    Return embeddings for texts, calling embed only for texts not already cached
+
+    A cache outage just means calling embed for every text.
+
+    Args:
+        texts: Texts to embed
+        embed: Batch embedding function used on cache misses
+        model: Embedding model name, part of the cache key
+
+    Returns:
+        One embedding per text, in order; an empty list for each text that failed
+    """
+    if not texts:
+        return []
+
+    keys = [_cache_key(model, text) for text in texts]
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+
+    try:
+        for i, cached in enumerate(await _get_redis().mget(keys)):
+            if cached:
+                embeddings[i] = array('f', cached).tolist()
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed: {e}")
+
+    misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if not misses:
+        return embeddings
+
+    fresh = await embed([texts[i] for i in misses])
+    if len(fresh) != len(misses):
+        fresh = [[] for _ in misses]
+
+    for i, embedding in zip(misses, fresh):
+        embeddings[i] = embedding
+
+    try:
+        async with _get_redis().pipeline(transaction=False) as pipe:
+            for i, embedding in zip(misses, fresh):
+                if embedding:
+                    pipe.set(keys[i], array('f', embedding).tobytes(), ex=EMBED_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Embedding cache write failed: {e}")
+
+    return embeddings
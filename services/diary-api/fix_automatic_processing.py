@@ -17,13 +17,15 @@ from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional
 import json
 import re
-from datetime import datetime
-from uuid import uuid4
+from datetime import datetime, timezone
+from itertools import combinations, islice
+from uuid import NAMESPACE_URL, uuid5
 
 # Add the app directory to Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from app.database.connection import db_manager
+from app.services import embedding_cache
 import httpx
 import asyncpg
 from neo4j import AsyncGraphDatabase
@@ -31,6 +33,77 @@ from neo4j import AsyncGraphDatabase
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _content_views(content: str) -> Dict[str, str]:
+    """Slice a document's content once into the prefixes each pipeline stage uses
+    
+    Re-slicing a view to the same length downstream returns the same string
+    object, so stages that still apply their own limit copy nothing.
+    """
+    return {
+        "ner": content[:3000],
+        "relations": content[:2000],
+        "embed": content[:8000],
+        "graph": content[:500],
+        "payload": content[:1000],
+    }
+
+_JSON_DECODER = json.JSONDecoder()
+
+def _parse_json_array(text: str) -> Optional[list]:
+    """Return the first JSON array embedded in an LLM response, or None"""
+    start = text.find('[')
+    while start >= 0:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(text, start)
+            if isinstance(value, list):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find('[', start + 1)
+    return None
+
+# Unprocessed documents are fetched with keyset pagination in pages of this size
+UNPROCESSED_PAGE_SIZE = 64
+
+# Newest unprocessed documents first; later pages continue strictly after the
+# (created_at, id) of the previous page's last row. Status lives in metadata:
+# this pipeline stores vectors in Qdrant and never writes documents.embeddings.
+_SELECT_UNPROCESSED_SQL = """
+    SELECT id, title, content, project, doc_type, tags, metadata, created_at
+    FROM documents
+    WHERE (metadata->>'entities_extracted' IS NULL
+           OR metadata->>'relationships_created' IS NULL
+           OR metadata->>'embeddings_generated' = 'false')
+      {after}
+    ORDER BY created_at DESC NULLS LAST, id DESC
+    LIMIT $1
+"""
+SELECT_UNPROCESSED_SQL = _SELECT_UNPROCESSED_SQL.format(after="")
+SELECT_UNPROCESSED_AFTER_SQL = _SELECT_UNPROCESSED_SQL.format(after="AND (created_at, id) < ($2, $3)")
+
+# Qdrant point ids are derived from the document id, so reprocessing a
+# document overwrites its existing point instead of adding a duplicate
+DOC_NAMESPACE = uuid5(NAMESPACE_URL, "finderskeepers/documents")
+
+# Merge processing status into a document's metadata, server-side
+UPDATE_METADATA_SQL = """
+    UPDATE documents 
+    SET metadata = coalesce(metadata, '{}'::jsonb) || $2::jsonb,
+        updated_at = NOW()
+    WHERE id = $1
+"""
+
+# Fallback NER patterns, compiled once at import
+_FILE_RE = re.compile(r'[a-zA-Z0-9_\-/]+\.[a-zA-Z]{2,4}')
+_URL_RE = re.compile(r'https?://[^\s<>"\']+')
+_CODE_PATTERNS = (
+    (re.compile(r'class\s+([A-Z][a-zA-Z0-9_]*)'), "CLASS"),
+    (re.compile(r'def\s+([a-z_][a-zA-Z0-9_]*)'), "FUNCTION"),
+    (re.compile(r'const\s+([A-Z_][A-Z0-9_]*)'), "CONSTANT"),
+)
+_TECH_RE = re.compile(r'\b([A-Z][a-zA-Z]+(?:[A-Z][a-zA-Z]+)*)\b')
+_TECH_KEYWORDS = frozenset({'Docker', 'Python', 'FastAPI', 'PostgreSQL', 'Neo4j', 'Redis', 'Ollama'})
+
 class AutomaticProcessingPipeline:
     """Automatic document processing pipeline that triggers on document creation"""
     
@@ -43,74 +116,218 @@ class AutomaticProcessingPipeline:
         self.neo4j_user = os.getenv("NEO4J_USER", "neo4j")
         self.neo4j_password = os.getenv("NEO4J_PASSWORD", "fk2025neo4j")
         self.qdrant_url = os.getenv("QDRANT_URL", "http://qdrant:6333")
+        self.embed_batch_size = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+        # Documents processed at once; keep at or below Ollama's OLLAMA_NUM_PARALLEL
+        # and well under the PostgreSQL/Neo4j connection pool sizes
+        self.concurrency = int(os.getenv("PIPELINE_CONCURRENCY", "4"))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.pool: Optional[asyncpg.Pool] = None
+        self.http: Optional[httpx.AsyncClient] = None
+        self.neo4j_driver = None
+        self.qdrant = None
+        self._stop_listening: Optional[asyncio.Event] = None
+        self._tasks: set = set()
+        self.qdrant_collection = "fk2_documents"
+        self._collection_ready: Optional[int] = None  # vector size of the verified collection
+        self._collection_lock = asyncio.Lock()
+    
+    async def _get_pool(self) -> asyncpg.Pool:
+        """Lazily create the PostgreSQL connection pool shared by every pipeline stage"""
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                self.postgres_url,
+                min_size=5,
+                max_size=20,
+                max_inactive_connection_lifetime=300
+            )
+        return self.pool
+    
+    def _get_http(self) -> httpx.AsyncClient:
+        """Lazily create the keep-alive HTTP client shared by all Ollama calls"""
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                timeout=httpx.Timeout(300.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_keepalive_connections=40,
+                    max_connections=100,
+                    keepalive_expiry=30.0
+                )
+            )
+        return self.http
+    
+    def _get_neo4j(self):
+        """Lazily create the Neo4j driver; it pools Bolt connections internally"""
+        if self.neo4j_driver is None:
+            self.neo4j_driver = AsyncGraphDatabase.driver(
+                self.neo4j_uri,
+                auth=(self.neo4j_user, self.neo4j_password),
+                max_connection_pool_size=50
+            )
+        return self.neo4j_driver
+    
+    def _get_qdrant(self):
+        """Lazily create the shared Qdrant client"""
+        if self.qdrant is None:
+            from qdrant_client import AsyncQdrantClient
+            self.qdrant = AsyncQdrantClient(url=self.qdrant_url)
+        return self.qdrant
+    
+    async def shutdown(self):
+        """Close shared connections"""
+        await embedding_cache.close()
+        if self.qdrant is not None:
+            await self.qdrant.close()
+            self.qdrant = None
+        if self.neo4j_driver is not None:
+            await self.neo4j_driver.close()
+            self.neo4j_driver = None
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
         
-    async def process_unprocessed_documents(self):
-        """Find and process documents that haven't been fully processed"""
-        conn = await asyncpg.connect(self.postgres_url)
+    async def process_unprocessed_documents(self, limit: Optional[int] = 10):
+        """Find and process documents that haven't been fully processed
         
-        try:
-            # Find documents without embeddings or relationships
-            unprocessed = await conn.fetch("""
-                SELECT id, title, content, project, doc_type, tags, metadata
-                FROM documents
-                WHERE embeddings IS NULL 
-                   OR metadata->>'entities_extracted' IS NULL
-                   OR metadata->>'relationships_created' IS NULL
-                ORDER BY created_at DESC
-                LIMIT 10
-            """)
+        Walks candidates newest first, one short keyset query on
+        (created_at, id) per page of UNPROCESSED_PAGE_SIZE, so no connection or
+        snapshot is held while a page is processed; pass limit=None to drain
+        the whole backlog.
+        """
+        processed = 0
+        last_key = None
+        pool = await self._get_pool()
+        while limit is None or processed < limit:
+            page_size = UNPROCESSED_PAGE_SIZE if limit is None else min(UNPROCESSED_PAGE_SIZE, limit - processed)
             
-            logger.info(f"🔍 Found {len(unprocessed)} unprocessed documents")
+            # Find documents without embeddings or relationships
+            if last_key is None:
+                page = await pool.fetch(SELECT_UNPROCESSED_SQL, page_size)
+            else:
+                page = await pool.fetch(SELECT_UNPROCESSED_AFTER_SQL, page_size, *last_key)
+            if not page:
+                break
             
-            for doc in unprocessed:
-                await self.process_document(dict(doc))
-                
-        finally:
-            await conn.close()
+            logger.info(f"🔍 Found {len(page)} unprocessed documents")
+            await self._process_page([dict(doc) for doc in page])
+            processed += len(page)
+            last_key = (page[-1]['created_at'], page[-1]['id'])
+        
+        logger.info(f"✅ Processed {processed} documents")
+    
+    async def _process_page(self, docs: List[Dict[str, Any]]):
+        """Embed, process and index one page of documents"""
+        # Embed every document in the page with one Ollama request
+        all_embeddings = await self.generate_embeddings_batch([doc['content'] for doc in docs])
+        
+        # Process documents concurrently, bounded by PIPELINE_CONCURRENCY,
+        # collecting their Qdrant points and metadata updates for batched writes
+        vector_batch: List[Tuple[Dict, List[float], List[Tuple]]] = []
+        metadata_batch: List[Tuple[Any, str]] = []
+        await asyncio.gather(
+            *(
+                self._run(doc, embeddings, vector_batch, metadata_batch)
+                for doc, embeddings in zip(docs, all_embeddings)
+            ),
+            return_exceptions=True
+        )
+        await self.store_batch_in_vector_db(vector_batch)
+        
+        if metadata_batch:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                await conn.executemany(UPDATE_METADATA_SQL, metadata_batch)
     
-    async def process_document(self, doc: Dict[str, Any]):
-        """Process a single document through the complete pipeline"""
+    async def _run(
+        self,
+        doc: Dict[str, Any],
+        embeddings: Optional[List[float]] = None,
+        vector_batch: Optional[List[Tuple[Dict, List[float], List[Tuple]]]] = None,
+        metadata_batch: Optional[List[Tuple[Any, str]]] = None
+    ):
+        """Process a document while holding a pipeline concurrency slot"""
+        async with self._semaphore:
+            await self.process_document(doc, embeddings, vector_batch, metadata_batch)
+    
+    async def process_document(
+        self,
+        doc: Dict[str, Any],
+        embeddings: Optional[List[float]] = None,
+        vector_batch: Optional[List[Tuple[Dict, List[float], List[Tuple]]]] = None,
+        metadata_batch: Optional[List[Tuple[Any, str]]] = None
+    ):
+        """Process a single document through the complete pipeline
+        
+        Pass precomputed embeddings (from generate_embeddings_batch) to skip step 2,
+        a vector_batch list to defer the Qdrant write to store_batch_in_vector_db,
+        and a metadata_batch list to defer the status update to one executemany.
+        """
         logger.info(f"📄 Processing document: {doc['title']}")
         
+        # Slice the content once for every stage that only needs a prefix
+        views = doc['views'] = _content_views(doc['content'])
+        
         try:
-            # Step 1: Extract entities using improved NER
-            entities = await self.extract_entities_advanced(doc['content'])
+            # Steps 1+2: Extract entities and generate embeddings concurrently
+            # (embedding is skipped when batched by the caller)
+            if embeddings is None:
+                entities, embeddings = await asyncio.gather(
+                    self.extract_entities_advanced(doc['content'], views['ner']),
+                    self.generate_embeddings(views['embed'])
+                )
+            else:
+                entities = await self.extract_entities_advanced(doc['content'], views['ner'])
             logger.info(f"  ✅ Extracted {len(entities)} entities")
-            
-            # Step 2: Generate embeddings
-            embeddings = await self.generate_embeddings(doc['content'])
             logger.info(f"  ✅ Generated {len(embeddings)} dimensional embeddings")
             
-            # Step 3: Create knowledge graph relationships
-            relationships = await self.create_knowledge_graph(doc, entities)
+            # Steps 3+4: Build the Neo4j graph and store in Qdrant concurrently
+            # (or queue the Qdrant point for the caller's batched upsert)
+            if vector_batch is not None:
+                relationships = await self.create_knowledge_graph(doc, entities)
+                vector_batch.append((doc, embeddings, entities))
+            else:
+                relationships, _ = await asyncio.gather(
+                    self.create_knowledge_graph(doc, entities),
+                    self.store_in_vector_db(doc, embeddings, entities)
+                )
+                logger.info(f"  ✅ Stored in Qdrant vector database")
             logger.info(f"  ✅ Created {len(relationships)} relationships in Neo4j")
             
-            # Step 4: Store in vector database
-            await self.store_in_vector_db(doc, embeddings, entities)
-            logger.info(f"  ✅ Stored in Qdrant vector database")
-            
-            # Step 5: Update document metadata
-            await self.update_document_metadata(doc['id'], {
+            # Step 5: Update document metadata (or queue it for the caller)
+            metadata_updates = {
                 "entities_extracted": True,
                 "entity_count": len(entities),
                 "relationships_created": True,
                 "relationship_count": len(relationships),
-                "embeddings_generated": True,
+                # False when embedding failed; the unprocessed selection picks it up again
+                "embeddings_generated": bool(embeddings),
                 "embedding_dimensions": len(embeddings),
-                "processed_at": datetime.utcnow().isoformat()
-            })
+                "processed_at": datetime.now(timezone.utc).isoformat()
+            }
+            if metadata_batch is not None:
+                metadata_batch.append((doc['id'], json.dumps(metadata_updates)))
+            else:
+                await self.update_document_metadata(doc['id'], metadata_updates)
             
             logger.info(f"✨ Successfully processed document: {doc['title']}")
             
         except Exception as e:
             logger.error(f"❌ Failed to process document {doc['id']}: {e}")
     
-    async def extract_entities_advanced(self, content: str) -> List[Tuple[str, str, Dict]]:
+    async def extract_entities_advanced(
+        self, content: str, ner_text: Optional[str] = None
+    ) -> List[Tuple[str, str, Dict]]:
         """
         Advanced entity extraction using Ollama for NER
+        ner_text: precomputed prompt prefix of content (defaults to content[:3000]);
+        the regex fallback still scans the full content
         Returns: List of (entity_type, entity_name, metadata) tuples
         """
         entities = []
+        if ner_text is None:
+            ner_text = content[:3000]
         
         # Use Ollama for entity extraction
         extraction_prompt = f"""
@@ -124,52 +341,42 @@ class AutomaticProcessingPipeline:
             ...
         ]
         
-        Text: {content[:3000]}
+        Text: {ner_text}
         
         Response (JSON only):
         """
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.chat_model,
-                        "prompt": extraction_prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.3,
-                            "num_predict": 1024
-                        }
+            response = await self._get_http().post(
+                f"{self.ollama_url}/api/generate",
+                timeout=60.0,
+                json={
+                    "model": self.chat_model,
+                    "prompt": extraction_prompt,
+                    "stream": False,
+                    "options": {
+                        "temperature": 0.3,
+                        "num_predict": 1024
                     }
-                )
+                }
+            )
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    response_text = result.get("response", "[]")
+            if response.status_code == 200:
+                result = response.json()
+                response_text = result.get("response", "[]")
                     
-                    # Parse JSON response
-                    try:
-                        # Clean up response if needed
-                        response_text = response_text.strip()
-                        if not response_text.startswith('['):
-                            # Find JSON array in response
-                            start = response_text.find('[')
-                            end = response_text.rfind(']') + 1
-                            if start >= 0 and end > start:
-                                response_text = response_text[start:end]
-                        
-                        extracted = json.loads(response_text)
-                        
-                        for entity in extracted:
-                            if isinstance(entity, dict) and 'type' in entity and 'name' in entity:
-                                entities.append((
-                                    entity['type'],
-                                    entity['name'],
-                                    {"context": entity.get('context', ''), "source": "ollama_ner"}
-                                ))
-                    except json.JSONDecodeError:
-                        logger.warning("Failed to parse Ollama NER response as JSON")
+                # Parse the first JSON array in the response (tolerates surrounding prose)
+                extracted = _parse_json_array(response_text)
+                if extracted is None:
+                    logger.warning("Failed to parse Ollama NER response as JSON")
+                else:
+                    for entity in extracted:
+                        if isinstance(entity, dict) and 'type' in entity and 'name' in entity:
+                            entities.append((
+                                entity['type'],
+                                entity['name'],
+                                {"context": entity.get('context', ''), "source": "ollama_ner"}
+                            ))
         
         except Exception as e:
             logger.warning(f"Ollama NER failed: {e}, falling back to regex")
@@ -192,66 +399,91 @@ class AutomaticProcessingPipeline:
         entities = []
         
         # Extract file paths
-        file_pattern = r'[a-zA-Z0-9_\-/]+\.[a-zA-Z]{2,4}'
-        for match in re.findall(file_pattern, content):
+        for match in _FILE_RE.findall(content):
             if len(match) > 5:
                 entities.append(("FILE", match, {"source": "regex"}))
         
         # Extract URLs
-        url_pattern = r'https?://[^\s<>"\']+'
-        for match in re.findall(url_pattern, content):
+        for match in _URL_RE.findall(content):
             entities.append(("URL", match, {"source": "regex"}))
         
         # Extract code elements
-        code_patterns = [
-            (r'class\s+([A-Z][a-zA-Z0-9_]*)', "CLASS"),
-            (r'def\s+([a-z_][a-zA-Z0-9_]*)', "FUNCTION"),
-            (r'const\s+([A-Z_][A-Z0-9_]*)', "CONSTANT"),
-        ]
-        
-        for pattern, entity_type in code_patterns:
-            for match in re.findall(pattern, content):
+        for pattern, entity_type in _CODE_PATTERNS:
+            for match in pattern.findall(content):
                 entities.append((entity_type, match, {"source": "regex"}))
         
         # Extract potential technology names (capitalized words)
-        tech_pattern = r'\b([A-Z][a-zA-Z]+(?:[A-Z][a-zA-Z]+)*)\b'
-        tech_keywords = ['Docker', 'Python', 'FastAPI', 'PostgreSQL', 'Neo4j', 'Redis', 'Ollama']
-        for match in re.findall(tech_pattern, content):
-            if match in tech_keywords or len(match) > 3:
+        for match in _TECH_RE.findall(content):
+            if match in _TECH_KEYWORDS or len(match) > 3:
                 entities.append(("TECHNOLOGY", match, {"source": "regex"}))
         
         return entities[:30]  # Limit
     
     async def generate_embeddings(self, content: str) -> List[float]:
         """Generate embeddings using Ollama with retry logic"""
+        return (await self.generate_embeddings_batch([content]))[0]
+    
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for many texts, serving repeats from the shared embedding cache"""
+        texts = [text[:8000] for text in texts]  # Limit content size
+        return await embedding_cache.get_or_embed(texts, self._request_embeddings, self.embedding_model)
+    
+    async def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for many texts in Ollama /api/embed requests of OLLAMA_EMBED_BATCH_SIZE"""
+        batches = await asyncio.gather(*(
+            self._request_embeddings_batch(texts[i:i + self.embed_batch_size])
+            for i in range(0, len(texts), self.embed_batch_size)
+        ))
+        return [embeddings for batch in batches for embeddings in batch]
+    
+    async def _request_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one sub-batch with retry logic, splitting it in half on timeouts and server errors"""
         max_retries = 3
         retry_delay = 2
         
         for attempt in range(max_retries):
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{self.ollama_url}/api/embed",
-                        json={
-                            "model": self.embedding_model,
-                            "input": content[:8000]  # Limit content size
-                        }
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        embeddings = data.get("embeddings", [])
-                        if embeddings and len(embeddings) > 0:
-                            return embeddings[0] if isinstance(embeddings[0], list) else embeddings
+                response = await self._get_http().post(
+                    f"{self.ollama_url}/api/embed",
+                    timeout=30.0 + 2.0 * (len(texts) - 1),
+                    json={
+                        "model": self.embedding_model,
+                        "input": texts
+                    }
+                )
+                
+                if response.status_code == 200:
+                    data = response.json()
+                    embeddings = data.get("embeddings", [])
+                    if len(embeddings) == len(texts):
+                        return embeddings
+                    logger.warning(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                elif response.status_code >= 500 and len(texts) > 1:
+                    return await self._split_embeddings_batch(texts, f"HTTP {response.status_code}")
                     
+            except httpx.TimeoutException as e:
+                if len(texts) > 1:
+                    return await self._split_embeddings_batch(texts, f"timeout {e!r}")
+                logger.warning(f"Embedding generation attempt {attempt + 1} failed: {e!r}")
             except Exception as e:
                 logger.warning(f"Embedding generation attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
+            
+            if attempt < max_retries - 1:
+                await asyncio.sleep(retry_delay)
         
         # Return empty embeddings if all retries fail
-        logger.error("All embedding generation attempts failed")
-        return []
+        logger.error(f"All embedding generation attempts failed for {len(texts)} text(s)")
+        return [[] for _ in texts]
+    
+    async def _split_embeddings_batch(self, texts: List[str], reason: str) -> List[List[float]]:
+        """Retry a failed sub-batch as two halves so one bad request only costs its own texts"""
+        logger.warning(f"Embedding {len(texts)} texts failed ({reason}), retrying in halves")
+        middle = len(texts) // 2
+        first, second = await asyncio.gather(
+            self._request_embeddings_batch(texts[:middle]),
+            self._request_embeddings_batch(texts[middle:])
+        )
+        return first + second
 
     async def infer_entity_relationships(
         self, content: str, entities: List[Tuple]
@@ -274,36 +506,29 @@ JSON:"""
         relationships: List[Tuple[str, str, str, str]] = []
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.chat_model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {"temperature": 0.2, "num_predict": 512},
-                    },
-                )
+            response = await self._get_http().post(
+                f"{self.ollama_url}/api/generate",
+                timeout=60.0,
+                json={
+                    "model": self.chat_model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "options": {"temperature": 0.2, "num_predict": 512},
+                },
+            )
 
             if response.status_code == 200:
                 resp_text = response.json().get("response", "[]")
-                start = resp_text.find("[")
-                end = resp_text.rfind("]") + 1
-                if start >= 0 and end > start:
-                    try:
-                        data = json.loads(resp_text[start:end])
-                        for item in data:
-                            if all(k in item for k in ["source", "target", "relationship"]):
-                                relationships.append(
-                                    (
-                                        item["source"],
-                                        item["target"],
-                                        item["relationship"],
-                                        item.get("context", ""),
-                                    )
-                                )
-                    except Exception:
-                        pass
+                for item in _parse_json_array(resp_text) or []:
+                    if isinstance(item, dict) and all(k in item for k in ["source", "target", "relationship"]):
+                        relationships.append(
+                            (
+                                item["source"],
+                                item["target"],
+                                item["relationship"],
+                                item.get("context", ""),
+                            )
+                        )
         except Exception:
             pass
 
@@ -313,222 +538,228 @@ JSON:"""
         """Create rich knowledge graph relationships in Neo4j"""
         relationships = []
 
-        inferred = await self.infer_entity_relationships(doc.get('content', ''), entities)
+        views = doc.get('views') or _content_views(doc.get('content', ''))
+        inferred = await self.infer_entity_relationships(views['relations'], entities)
 
-        driver = AsyncGraphDatabase.driver(
-            self.neo4j_uri,
-            auth=(self.neo4j_user, self.neo4j_password)
-        )
+        # Every statement runs in one write transaction, so a document's graph
+        # is written completely or not at all
+        statements: List[Tuple[str, Dict[str, Any]]] = []
 
-        try:
-            async with driver.session() as session:
-                # Create document node
-                await session.run("""
-                    MERGE (d:Document {id: $id})
-                    SET d.title = $title,
-                        d.project = $project,
-                        d.doc_type = $doc_type,
-                        d.content_preview = $content_preview,
-                        d.updated_at = datetime()
-                """, {
-                    "id": str(doc['id']),
-                    "title": doc['title'],
-                    "project": doc['project'],
-                    "doc_type": doc['doc_type'],
-                    "content_preview": doc['content'][:500]
-                })
-
-                # Create project node and relationship
-                await session.run("""
-                    MATCH (d:Document {id: $doc_id})
-                    MERGE (p:Project {name: $project})
-                    MERGE (d)-[:BELONGS_TO]->(p)
-                """, {
-                    "doc_id": str(doc['id']),
-                    "project": doc['project']
-                })
-                relationships.append({"type": "BELONGS_TO", "target": doc['project']})
-
-                # Create entity nodes and relationships
-                for entity_type, entity_name, metadata in entities:
-                    # Create entity node
-                    await session.run("""
-                        MERGE (e:Entity {name: $name, type: $type})
-                        SET e.updated_at = datetime()
-                    """, {
-                        "name": entity_name,
-                        "type": entity_type
-                    })
-
-                    # Create document-entity relationship
-                    await session.run("""
-                        MATCH (d:Document {id: $doc_id})
-                        MATCH (e:Entity {name: $entity_name, type: $entity_type})
-                        MERGE (d)-[r:MENTIONS]->(e)
-                        SET r.context = $context,
-                            r.count = coalesce(r.count, 0) + 1
-                    """, {
-                        "doc_id": str(doc['id']),
-                        "entity_name": entity_name,
-                        "entity_type": entity_type,
-                        "context": metadata.get('context', '')
-                    })
-                    relationships.append({
-                        "type": "MENTIONS",
-                        "entity": entity_name,
-                        "entity_type": entity_type
-                    })
-
-                # Create inferred relationships between entities
-                for source, target, rel, context in inferred:
-                    rel_type = re.sub(r"[^A-Z_]", "", rel.upper()) or "RELATED_TO"
-                    await session.run(
-                        f"""
-                        MATCH (e1:Entity {{name: $source}})
-                        MATCH (e2:Entity {{name: $target}})
-                        MERGE (e1)-[r:{rel_type}]->(e2)
-                        SET r.context = $context,
-                            r.source_doc = $doc_id,
-                            r.updated_at = datetime()
-                        """,
-                        {
-                            "source": source,
-                            "target": target,
-                            "context": context,
-                            "doc_id": str(doc['id'])
-                        }
-                    )
-                    relationships.append({
-                        "type": rel_type,
-                        "source": source,
-                        "target": target,
-                        "context": context
-                    })
-
-                # Create entity-to-entity relationships based on co-occurrence
-                entity_pairs = []
-                for i, (type1, name1, _) in enumerate(entities):
-                    for type2, name2, _ in entities[i+1:]:
-                        if name1 != name2:
-                            entity_pairs.append((name1, type1, name2, type2))
-
-                for name1, type1, name2, type2 in entity_pairs[:20]:  # Limit relationships
-                    await session.run("""
-                        MATCH (e1:Entity {name: $name1, type: $type1})
-                        MATCH (e2:Entity {name: $name2, type: $type2})
-                        MERGE (e1)-[r:RELATED_TO]->(e2)
-                        SET r.count = coalesce(r.count, 0) + 1,
-                            r.source_doc = $doc_id,
-                            r.updated_at = datetime()
-                    """, {
-                        "name1": name1,
-                        "type1": type1,
-                        "name2": name2,
-                        "type2": type2,
-                        "doc_id": str(doc['id'])
-                    })
-                    relationships.append({
-                        "type": "RELATED_TO",
-                        "source": name1,
-                        "target": name2
-                    })
+        # Create document node, project node and relationship
+        statements.append(("""
+            MERGE (d:Document {id: $id})
+            SET d.title = $title,
+                d.project = $project,
+                d.doc_type = $doc_type,
+                d.content_preview = $content_preview,
+                d.updated_at = datetime()
+            MERGE (p:Project {name: $project})
+            MERGE (d)-[:BELONGS_TO]->(p)
+        """, {
+            "id": str(doc['id']),
+            "title": doc['title'],
+            "project": doc['project'],
+            "doc_type": doc['doc_type'],
+            "content_preview": views['graph']
+        }))
+        relationships.append({"type": "BELONGS_TO", "target": doc['project']})
 
-        finally:
-            await driver.close()
+        # Create all entity nodes and document-entity relationships in one statement
+        if entities:
+            statements.append(("""
+                MATCH (d:Document {id: $doc_id})
+                UNWIND $rows AS row
+                MERGE (e:Entity {name: row.name, type: row.type})
+                SET e.updated_at = datetime()
+                MERGE (d)-[r:MENTIONS]->(e)
+                SET r.context = row.context,
+                    r.count = coalesce(r.count, 0) + 1
+            """, {
+                "doc_id": str(doc['id']),
+                "rows": [
+                    {"name": entity_name, "type": entity_type, "context": metadata.get('context', '')}
+                    for entity_type, entity_name, metadata in entities
+                ]
+            }))
+            relationships.extend(
+                {"type": "MENTIONS", "entity": entity_name, "entity_type": entity_type}
+                for entity_type, entity_name, _ in entities
+            )
+
+        # Create inferred relationships between entities, one statement per
+        # relationship type (Cypher cannot parameterise relationship types)
+        inferred_by_type: Dict[str, List[Dict]] = {}
+        for source, target, rel, context in inferred:
+            rel_type = re.sub(r"[^A-Z_]", "", rel.upper()) or "RELATED_TO"
+            inferred_by_type.setdefault(rel_type, []).append(
+                {"source": source, "target": target, "context": context}
+            )
+            relationships.append({
+                "type": rel_type,
+                "source": source,
+                "target": target,
+                "context": context
+            })
+
+        for rel_type, rows in inferred_by_type.items():
+            statements.append((
+                f"""
+                UNWIND $rows AS row
+                MATCH (e1:Entity {{name: row.source}})
+                MATCH (e2:Entity {{name: row.target}})
+                MERGE (e1)-[r:{rel_type}]->(e2)
+                SET r.context = row.context,
+                    r.source_doc = $doc_id,
+                    r.updated_at = datetime()
+                """,
+                {"rows": rows, "doc_id": str(doc['id'])}
+            ))
+
+        # Create entity-to-entity relationships based on co-occurrence,
+        # stopping after the first 20 distinct-name pairs
+        pair_rows = list(islice(
+            (
+                {"name1": name1, "type1": type1, "name2": name2, "type2": type2}
+                for (type1, name1, _), (type2, name2, _) in combinations(entities, 2)
+                if name1 != name2
+            ),
+            20  # Limit relationships
+        ))
+        if pair_rows:
+            statements.append(("""
+                UNWIND $rows AS row
+                MATCH (e1:Entity {name: row.name1, type: row.type1})
+                MATCH (e2:Entity {name: row.name2, type: row.type2})
+                MERGE (e1)-[r:RELATED_TO]->(e2)
+                SET r.count = coalesce(r.count, 0) + 1,
+                    r.source_doc = $doc_id,
+                    r.updated_at = datetime()
+            """, {"rows": pair_rows, "doc_id": str(doc['id'])}))
+            relationships.extend(
+                {"type": "RELATED_TO", "source": row["name1"], "target": row["name2"]}
+                for row in pair_rows
+            )
+
+        async def write_graph(tx):
+            for query, params in statements:
+                result = await tx.run(query, params)
+                await result.consume()
+
+        async with self._get_neo4j().session() as session:
+            await session.execute_write(write_graph)
 
         return relationships
     
     async def store_in_vector_db(self, doc: Dict, embeddings: List[float], entities: List[Tuple]):
         """Store document embeddings in Qdrant vector database"""
-        if not embeddings:
-            logger.warning(f"No embeddings to store for document {doc['id']}")
+        await self.store_batch_in_vector_db([(doc, embeddings, entities)])
+    
+    async def _ensure_collection(self, vector_size: int) -> bool:
+        """Verify the Qdrant collection once per process and cache its vector size"""
+        if self._collection_ready is None:
+            async with self._collection_lock:
+                if self._collection_ready is None:
+                    from qdrant_client.models import VectorParams, Distance
+                    
+                    client = self._get_qdrant()
+                    try:
+                        collections = await client.get_collections()
+                        if any(c.name == self.qdrant_collection for c in collections.collections):
+                            info = await client.get_collection(self.qdrant_collection)
+                            vectors = info.config.params.vectors
+                            if isinstance(vectors, dict):
+                                # Named vectors: this pipeline writes the unnamed default vector
+                                default = vectors.get("")
+                                if default is None:
+                                    logger.error(
+                                        f"Qdrant collection {self.qdrant_collection} has only named "
+                                        f"vectors ({', '.join(vectors)}); skipping upsert"
+                                    )
+                                    return False  # Not ready; re-check on the next batch
+                                self._collection_ready = default.size
+                            else:
+                                self._collection_ready = vectors.size
+                        else:
+                            await client.create_collection(
+                                collection_name=self.qdrant_collection,
+                                vectors_config=VectorParams(
+                                    size=vector_size,
+                                    distance=Distance.COSINE
+                                )
+                            )
+                            self._collection_ready = vector_size
+                    except Exception as e:
+                        logger.error(f"Failed to prepare Qdrant collection: {e}")
+                        return False  # Re-check on the next batch
+        
+        if self._collection_ready != vector_size:
+            logger.error(
+                f"Embedding size {vector_size} does not match Qdrant collection "
+                f"{self.qdrant_collection} ({self._collection_ready}); skipping upsert"
+            )
+            return False
+        return True
+    
+    async def store_batch_in_vector_db(self, items: List[Tuple[Dict, List[float], List[Tuple]]]):
+        """Store many documents' embeddings in Qdrant with a single upsert"""
+        ready = []
+        for doc, embeddings, entities in items:
+            if embeddings:
+                ready.append((doc, embeddings, entities))
+            else:
+                logger.warning(f"No embeddings to store for document {doc['id']}")
+        
+        if not ready:
             return
         
         try:
-            from qdrant_client import AsyncQdrantClient
-            from qdrant_client.models import PointStruct, VectorParams, Distance
+            from qdrant_client.models import PointStruct
             
-            client = AsyncQdrantClient(url=self.qdrant_url)
-            
-            # Ensure collection exists
-            collection_name = "fk2_documents"
-            try:
-                collections = await client.get_collections()
-                if not any(c.name == collection_name for c in collections.collections):
-                    await client.create_collection(
-                        collection_name=collection_name,
-                        vectors_config=VectorParams(
-                            size=len(embeddings),
-                            distance=Distance.COSINE
-                        )
-                    )
-            except:
-                pass  # Collection might already exist
-            
-            # Create payload with rich metadata
-            payload = {
-                "document_id": str(doc['id']),
-                "title": doc['title'],
-                "content": doc['content'][:1000],  # Store preview
-                "project": doc['project'],
-                "doc_type": doc['doc_type'],
-                "tags": doc['tags'] if doc['tags'] else [],
-                "entities": [{"type": t, "name": n} for t, n, _ in entities[:20]],
-                "entity_count": len(entities),
-                "indexed_at": datetime.utcnow().isoformat()
-            }
+            if not await self._ensure_collection(len(ready[0][1])):
+                return
             
-            # Store in Qdrant
-            point = PointStruct(
-                id=str(uuid4()),
-                vector=embeddings,
-                payload=payload
-            )
+            indexed_at = datetime.now(timezone.utc).isoformat()
+            points = [
+                PointStruct(
+                    id=str(uuid5(DOC_NAMESPACE, str(doc['id']))),
+                    vector=embeddings,
+                    # Create payload with rich metadata
+                    payload={
+                        "document_id": str(doc['id']),
+                        "title": doc['title'],
+                        "content": (doc.get('views') or _content_views(doc['content']))['payload'],  # Store preview
+                        "project": doc['project'],
+                        "doc_type": doc['doc_type'],
+                        "tags": doc['tags'] if doc['tags'] else [],
+                        "entities": [{"type": t, "name": n} for t, n, _ in entities[:20]],
+                        "entity_count": len(entities),
+                        "indexed_at": indexed_at
+                    }
+                )
+                for doc, embeddings, entities in ready
+            ]
             
-            await client.upsert(
-                collection_name=collection_name,
-                points=[point]
+            await self._get_qdrant().upsert(
+                collection_name=self.qdrant_collection,
+                points=points
             )
             
-            logger.info(f"  ✅ Stored document {doc['id']} in Qdrant")
+            logger.info(f"  ✅ Stored {len(points)} document(s) in Qdrant")
             
         except Exception as e:
             logger.error(f"Failed to store in Qdrant: {e}")
     
     async def update_document_metadata(self, doc_id: str, metadata_updates: Dict):
         """Update document metadata to track processing status"""
-        conn = await asyncpg.connect(self.postgres_url)
-        
-        try:
-            # Get existing metadata
-            existing = await conn.fetchval("""
-                SELECT metadata FROM documents WHERE id = $1
-            """, doc_id)
-            
-            if existing:
-                metadata = json.loads(existing) if isinstance(existing, str) else existing
-            else:
-                metadata = {}
-            
-            # Update metadata
-            metadata.update(metadata_updates)
-            
-            # Store updated metadata
-            await conn.execute("""
-                UPDATE documents 
-                SET metadata = $2,
-                    updated_at = NOW()
-                WHERE id = $1
-            """, doc_id, json.dumps(metadata))
-            
-        finally:
-            await conn.close()
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            # Merge the updates into existing metadata atomically, server-side
+            await conn.execute(UPDATE_METADATA_SQL, doc_id, json.dumps(metadata_updates))
     
     async def setup_automatic_trigger(self):
         """Setup PostgreSQL trigger for automatic processing"""
-        conn = await asyncpg.connect(self.postgres_url)
-        
-        try:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
             # Create notification function
             await conn.execute("""
                 CREATE OR REPLACE FUNCTION notify_document_insert()
@@ -550,12 +781,35 @@ JSON:"""
             """)
             
             logger.info("✅ Automatic processing trigger created")
-            
-        finally:
-            await conn.close()
+    
+    async def ensure_graph_schema(self):
+        """Create Neo4j uniqueness constraints so MERGE lookups use an index instead of a label scan
+        
+        Best-effort: an unreachable Neo4j or existing duplicate nodes only skip the
+        affected constraint, so document processing still runs.
+        """
+        ensured = 0
+        async with self._get_neo4j().session() as session:
+            for statement in (
+                "CREATE CONSTRAINT entity_name_type IF NOT EXISTS "
+                "FOR (e:Entity) REQUIRE (e.name, e.type) IS UNIQUE",
+                "CREATE CONSTRAINT document_id IF NOT EXISTS "
+                "FOR (d:Document) REQUIRE d.id IS UNIQUE",
+                "CREATE CONSTRAINT project_name IF NOT EXISTS "
+                "FOR (p:Project) REQUIRE p.name IS UNIQUE",
+            ):
+                try:
+                    result = await session.run(statement)
+                    await result.consume()
+                    ensured += 1
+                except Exception as e:
+                    logger.warning(f"⚠️  Could not ensure Neo4j constraint ({statement.split()[2]}): {e}")
+        
+        logger.info(f"✅ Neo4j graph constraints ensured ({ensured}/3)")
     
     async def listen_for_new_documents(self):
         """Listen for new document notifications and process them"""
+        # LISTEN state lives on one connection, so this stays outside the shared pool
         conn = await asyncpg.connect(self.postgres_url)
         
         try:
@@ -564,28 +818,35 @@ JSON:"""
             
             logger.info("👂 Listening for new documents...")
             
-            # Keep connection alive
-            while True:
-                await asyncio.sleep(60)
+            # asyncpg dispatches notifications itself; just hold the connection until stopped
+            self._stop_listening = asyncio.Event()
+            await self._stop_listening.wait()
                 
         finally:
             await conn.close()
     
+    def stop_listening(self):
+        """Stop listen_for_new_documents and release its connection"""
+        if self._stop_listening is not None:
+            self._stop_listening.set()
+    
     async def handle_new_document(self, connection, pid, channel, payload):
         """Handle new document notification"""
         logger.info(f"📨 New document notification: {payload}")
         
-        conn = await asyncpg.connect(self.postgres_url)
-        try:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
             doc = await conn.fetchrow("""
                 SELECT id, title, content, project, doc_type, tags, metadata
                 FROM documents WHERE id = $1
             """, payload)
-            
-            if doc:
-                await self.process_document(dict(doc))
-        finally:
-            await conn.close()
+        
+        if doc:
+            # Process in the background so notifications are handled concurrently,
+            # bounded by the pipeline semaphore
+            task = asyncio.create_task(self._run(dict(doc)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
 
 async def main():
     """Main entry point for automatic processing pipeline"""
@@ -593,14 +854,20 @@ async def main():
     
     logger.info("🚀 Starting Automatic Document Processing Pipeline")
     
-    # Setup automatic trigger
-    await pipeline.setup_automatic_trigger()
-    
-    # Process any unprocessed documents
-    await pipeline.process_unprocessed_documents()
-    
-    # Start listening for new documents
-    # await pipeline.listen_for_new_documents()
+    try:
+        # Setup automatic trigger
+        await pipeline.setup_automatic_trigger()
+        
+        # Index the graph keys that every MERGE looks up
+        await pipeline.ensure_graph_schema()
+        
+        # Process any unprocessed documents
+        await pipeline.process_unprocessed_documents()
+        
+        # Start listening for new documents
+        # await pipeline.listen_for_new_documents()
+    finally:
+        await pipeline.shutdown()
     
     logger.info("✅ Automatic processing complete")
 
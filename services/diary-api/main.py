@@ -3,18 +3,21 @@ FindersKeepers v2 - FastAPI Diary & Knowledge Management API
 Personal AI Agent Knowledge Hub (July 2025)
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.security import HTTPBearer
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from datetime import datetime, timezone
 import os
+import sys
+import re
 import json
 import logging
+import time
 import httpx
 import asyncio
 from uuid import uuid4
@@ -33,6 +36,8 @@ from app.api.admin import router as admin_router  # NEW: Admin & maintenance end
 from app.api.background_admin import router as background_admin_router  # NEW: Background processor control
 from app.api.knowledge import router as knowledge_router  # NEW: Knowledge graph endpoints
 from app.database.connection import db_manager
+from app.database.migrations import apply_schema_migrations
+from app.services import embedding_cache
 from app.database.queries import StatsQueries, SessionQueries, DocumentQueries, ConversationQueries
 from app.api.chat_endpoints import ChatRequest, ChatResponse, process_chat_message
 
@@ -52,28 +57,91 @@ class OllamaClient:
         self.embedding_model = os.getenv("EMBEDDING_MODEL", "mxbai-embed-large")
         self.chat_model = os.getenv("CHAT_MODEL", "llama3:8b")
         self.use_local = os.getenv("USE_LOCAL_LLM", "true").lower() == "true"
+        self.embed_batch_size = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+        self._client: Optional[httpx.AsyncClient] = None
+        # Bound in-flight Ollama requests; match OLLAMA_NUM_PARALLEL on the server
+        self._semaphore = asyncio.Semaphore(int(os.getenv("OLLAMA_MAX_CONCURRENCY", "8")))
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Lazily create the keep-alive HTTP client shared by every Ollama call"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def get_embeddings(self, text: str, cached: bool = False) -> List[float]:
+        """Generate embeddings using local Ollama model, optionally through the Redis cache"""
+        embed = self.get_embeddings_cached if cached else self.get_embeddings_batch
+        embeddings = await embed([text])
+        return embeddings[0] if embeddings else []
+    
+    async def get_embeddings_cached(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings through the Redis embedding cache, embedding only misses"""
+        return await embedding_cache.get_or_embed(texts, self.get_embeddings_batch, self.embedding_model)
+    
+    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for many texts with batched Ollama /api/embed calls
         
-    async def get_embeddings(self, text: str) -> List[float]:
-        """Generate embeddings using local Ollama model"""
+        Inputs are split into sub-batches of OLLAMA_EMBED_BATCH_SIZE that are sent
+        concurrently; an empty list is returned if any sub-batch fails.
+        """
         if not self.use_local:
             logger.warning("Local LLM disabled, falling back to external API")
             return []
-            
+        
+        if not texts:
+            return []
+        
+        if len(texts) <= self.embed_batch_size:
+            return await self._embed(texts)
+        
+        batches = await asyncio.gather(*(
+            self._embed(texts[i:i + self.embed_batch_size])
+            for i in range(0, len(texts), self.embed_batch_size)
+        ))
+        embeddings = [embedding for batch in batches for embedding in batch]
+        return embeddings if len(embeddings) == len(texts) else []
+    
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed one sub-batch of texts with a single Ollama request
+        
+        A sub-batch that times out or hits a server error is split in half and retried.
+        """
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/embed",
+            async with self._semaphore:
+                response = await self._get_client().post(
+                    "/api/embed",
                     json={
                         "model": self.embedding_model,
-                        "input": text
-                    }
+                        "input": texts
+                    },
+                    timeout=30.0
                 )
                 response.raise_for_status()
-                data = response.json()
-                embeddings = data.get("embeddings", [])
-                # Ollama returns array of arrays, we need the first array
-                return embeddings[0] if embeddings and isinstance(embeddings[0], list) else embeddings
-                
+            data = response.json()
+            # Ollama returns one embedding per input, in order
+            return data.get("embeddings", [])
+            
+        except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            retryable = isinstance(e, httpx.TimeoutException) or e.response.status_code >= 500
+            if not retryable or len(texts) == 1:
+                logger.error(f"Ollama embedding failed: {e}")
+                return []
+            
+            logger.warning(f"Ollama embedding of {len(texts)} texts failed ({e}), retrying in halves")
+            middle = len(texts) // 2
+            first, second = await asyncio.gather(self._embed(texts[:middle]), self._embed(texts[middle:]))
+            embeddings = first + second
+            return embeddings if len(embeddings) == len(texts) else []
         except Exception as e:
             logger.error(f"Ollama embedding failed: {e}")
             return []
@@ -85,9 +153,9 @@ class OllamaClient:
             return ""
             
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
+            async with self._semaphore:
+                response = await self._get_client().post(
+                    "/api/generate",
                     json={
                         "model": self.chat_model,
                         "prompt": prompt,
@@ -99,9 +167,9 @@ class OllamaClient:
                     }
                 )
                 response.raise_for_status()
-                data = response.json()
-                return data.get("response", "")
-                
+            data = response.json()
+            return data.get("response", "")
+            
         except Exception as e:
             logger.error(f"Ollama text generation failed: {e}")
             return ""
@@ -109,9 +177,8 @@ class OllamaClient:
     async def health_check(self) -> bool:
         """Check if Ollama service is healthy"""
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.base_url}/api/version")
-                return response.status_code == 200
+            response = await self._get_client().get("/api/version", timeout=5.0)
+            return response.status_code == 200
         except:
             return False
 
@@ -123,7 +190,8 @@ app = FastAPI(
     description="Personal AI Agent Knowledge Hub - Where agents share memories and humans never lose context",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware for React frontend and web interfaces
@@ -246,40 +314,62 @@ class ConfigChange(BaseModel):
 
 class EmbeddingRequest(BaseModel):
     """Request for text embeddings"""
-    text: str = Field(..., description="Text to generate embeddings for")
+    text: Union[str, List[str]] = Field(..., description="Text, or list of texts, to generate embeddings for")
 
 # ========================================
 # HEALTH CHECK
 # ========================================
 
+_ROOT_RESPONSE = {
+    "service": "FindersKeepers v2 API",
+    "status": "running",
+    "version": "2.0.0",
+    "endpoints": {
+        "docs": "/docs",
+        "health": "/health",
+        "diary": "/api/diary/*",
+        "knowledge": "/api/knowledge/*",
+        "config": "/api/config/*",
+        "ingestion": "/api/v1/ingestion/*"
+    }
+}
+
 @app.get("/", tags=["System"])
 async def root():
     """Root endpoint with system information"""
-    return {
-        "service": "FindersKeepers v2 API",
-        "status": "running",
-        "version": "2.0.0",
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "endpoints": {
-            "docs": "/docs",
-            "health": "/health",
-            "diary": "/api/diary/*",
-            "knowledge": "/api/knowledge/*",
-            "config": "/api/config/*",
-            "ingestion": "/api/v1/ingestion/*"
-        }
-    }
+    return {**_ROOT_RESPONSE, "timestamp": datetime.now(timezone.utc).isoformat()}
 
 
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "3.0"))
+_health_cache: Dict[str, Any] = {"ts": 0.0, "data": None}
+_health_lock = asyncio.Lock()
+
 @app.get("/health", tags=["System"])
 async def health_check():
-    """System health check with REAL database status"""
-    try:
-        # Check Ollama service
-        ollama_healthy = await ollama_client.health_check()
+    """System health check with REAL database status
+    
+    Results are reused for HEALTH_CACHE_TTL seconds, and concurrent callers
+    share a single round of backend probes.
+    """
+    if time.monotonic() - _health_cache["ts"] < HEALTH_CACHE_TTL:
+        return _health_cache["data"]
+    
+    async with _health_lock:
+        if time.monotonic() - _health_cache["ts"] < HEALTH_CACHE_TTL:
+            return _health_cache["data"]
         
-        # Check ALL database services
-        db_health = await db_manager.health_check()
+        _health_cache["data"] = await _probe_health()
+        _health_cache["ts"] = time.monotonic()
+        return _health_cache["data"]
+
+async def _probe_health() -> Dict[str, Any]:
+    """Probe Ollama and ALL database services"""
+    try:
+        # Check Ollama service and ALL database services concurrently
+        ollama_healthy, db_health = await asyncio.gather(
+            ollama_client.health_check(),
+            db_manager.health_check()
+        )
         
         # Check n8n container status (simplified - assume running if we get here)
         n8n_healthy = True  # n8n is part of docker-compose, assume healthy
@@ -378,13 +468,43 @@ async def get_documents_list(
 # ========================================
 
 @app.post("/api/embeddings", tags=["Embeddings"])
-async def generate_embeddings(request: EmbeddingRequest):
-    """Generate embeddings for text using local Ollama model"""
+async def generate_embeddings(request: EmbeddingRequest, x_no_cache: Optional[str] = Header(None)):
+    """Generate embeddings for text using local Ollama model
+    
+    Accepts a single string or a list of strings; a list is embedded in one
+    Ollama request and returns one embedding per input, in order. Cached
+    embeddings are reused unless the request sends an x-no-cache header.
+    """
+    embed = ollama_client.get_embeddings_batch if x_no_cache else ollama_client.get_embeddings_cached
     try:
+        if isinstance(request.text, list):
+            if not request.text:
+                raise HTTPException(status_code=400, detail="text list must not be empty")
+            
+            logger.info(f"Generating embeddings for {len(request.text)} texts")
+            
+            # Generate all embeddings with one local Ollama request
+            embeddings = await embed(request.text)
+            
+            if len(embeddings) != len(request.text) or not all(embeddings):
+                raise HTTPException(
+                    status_code=503, 
+                    detail="Embedding generation failed - Ollama service may be unavailable"
+                )
+            
+            return {
+                "embeddings": embeddings,
+                "count": len(embeddings),
+                "dimensions": len(embeddings[0]),
+                "model": ollama_client.embedding_model,
+                "text_length": sum(len(text) for text in request.text),
+                "local_llm_used": ollama_client.use_local
+            }
+        
         logger.info(f"Generating embeddings for text (length: {len(request.text)})")
         
         # Generate embeddings using local Ollama
-        embeddings = await ollama_client.get_embeddings(request.text)
+        embeddings = await ollama_client.get_embeddings(request.text, cached=not x_no_cache)
         
         if not embeddings:
             raise HTTPException(
@@ -443,7 +563,9 @@ async def ingest_document(doc: DocumentIngest, background_tasks: BackgroundTasks
         
         # Use the enhanced pipeline processing (runs in background)
         from app.core.enhanced_ingestion import process_document_with_pipeline
-        background_tasks.add_task(process_document_with_pipeline, doc_data, document_id)
+        background_tasks.add_task(
+            process_document_with_pipeline, doc_data, document_id, ollama_client.get_embeddings_batch
+        )
         
         return {
             "status": "accepted",
@@ -1047,7 +1169,7 @@ async def vector_search(query: dict):
         logger.info(f"Real Qdrant vector search: {search_query}, limit={limit}, min_score={min_score}, collection={collection}")
         
         # Generate query embeddings using Ollama
-        query_vector = await ollama_client.get_embeddings(search_query)
+        query_vector = await ollama_client.get_embeddings(search_query, cached=True)
         if not query_vector:
             raise HTTPException(status_code=500, detail="Embedding generation failed")
         
@@ -1247,20 +1369,19 @@ async def semantic_search(request: dict):
         
         logger.info(f"REAL semantic search: {query}, limit={limit}, threshold={threshold}")
         
-        # Generate embeddings for semantic search using Ollama
-        query_embeddings = await ollama_client.get_embeddings(query)
-        
-        # Get REAL documents from database for semantic analysis
-        doc_results = await DocumentQueries.get_documents(
-            page=1,
-            limit=limit * 2,  # Get more for semantic filtering
-            search=query,
-            project=project
+        # Generate embeddings using Ollama while fetching REAL documents
+        # from the database for semantic analysis - the two are independent
+        query_embeddings, doc_results = await asyncio.gather(
+            ollama_client.get_embeddings(query, cached=True),
+            DocumentQueries.get_documents(
+                page=1,
+                limit=limit * 2,  # Get more for semantic filtering
+                search=query,
+                project=project
+            )
         )
         
-        # Process documents with semantic analysis using Ollama
-        results = []
-        for doc in doc_results.get("documents", []):
+        async def score_relevance(doc: Dict[str, Any]) -> float:
             # Use Ollama to analyze semantic relevance
             semantic_prompt = f"""
             Query: {query}
@@ -1275,15 +1396,22 @@ async def semantic_search(request: dict):
                 relevance_text = await ollama_client.generate_text(semantic_prompt, max_tokens=10)
                 try:
                     # Extract numeric score
-                    import re
                     score_match = re.search(r'(\d+\.?\d*)', relevance_text)
                     similarity_score = float(score_match.group(1)) if score_match else 0.5
-                    similarity_score = min(max(similarity_score, 0.0), 1.0)  # Clamp 0-1
+                    return min(max(similarity_score, 0.0), 1.0)  # Clamp 0-1
                 except:
-                    similarity_score = 0.5  # Default if parsing fails
+                    return 0.5  # Default if parsing fails
             except:
-                similarity_score = 0.5  # Default if Ollama fails
-            
+                return 0.5  # Default if Ollama fails
+        
+        # Score every document concurrently; Ollama runs up to
+        # OLLAMA_NUM_PARALLEL of these requests at once
+        documents = doc_results.get("documents", [])
+        scores = await asyncio.gather(*(score_relevance(doc) for doc in documents))
+        
+        # Process documents with semantic analysis using Ollama
+        results = []
+        for doc, similarity_score in zip(documents, scores):
             # Only include if above threshold
             if similarity_score >= threshold:
                 results.append({
@@ -1330,9 +1458,9 @@ async def log_config_change(change: ConfigChange):
         logger.info(f"Logging config change: {change.component} -> {change.new_value}")
         
         # TODO: Store in database and update knowledge graph
-        change_data = change.dict()
+        change_data = change.model_dump(mode="json")
         change_data["timestamp"] = datetime.now(timezone.utc).isoformat()
-        change_data["change_id"] = f"cfg_{int(datetime.now().timestamp())}"
+        change_data["change_id"] = f"cfg_{time.time_ns()}"
         
         return {
             "status": "logged",
@@ -2265,91 +2393,6 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
 # STARTUP EVENT
 # ========================================
 
-async def process_document_with_ollama(doc: DocumentIngest, embeddings: List[float]):
-    """Background task to process document with local embeddings"""
-    try:
-        logger.info(f"🔄 STEP 1: Starting background processing for '{doc.title}' with {len(embeddings)} embeddings")
-        
-        import sys
-        import os
-        sys.path.append(os.path.dirname(__file__))
-        
-        logger.info(f"🔄 STEP 2: Starting imports for '{doc.title}'")
-        
-        from app.api.v1.ingestion.storage import StorageService
-        from app.api.v1.ingestion.models import IngestionRequest, ProcessedChunk, DocumentMetadata, FileFormat, ProcessingMethod, ChunkMetadata
-        from uuid import uuid4
-        
-        logger.info(f"📦 STEP 3: Imports successful, processing document '{doc.title}'")
-        
-        # Initialize storage service
-        storage = StorageService()
-        
-        # Create ingestion request with doc_type in metadata
-        metadata_with_doc_type = {
-            **doc.metadata,
-            "doc_type": doc.doc_type
-        }
-        
-        ingestion_request = IngestionRequest(
-            ingestion_id=f"ing_{uuid4().hex[:8]}",
-            file_path=f"/tmp/{doc.title}.md",
-            filename=f"{doc.title}.md",
-            project=doc.project,
-            tags=doc.tags,
-            metadata=metadata_with_doc_type,
-            file_size=len(doc.content.encode()),
-            mime_type="text/markdown"
-        )
-        
-        # Create document metadata
-        document_metadata = DocumentMetadata(
-            title=doc.title,
-            format=FileFormat.MD,
-            processing_method=ProcessingMethod.CUSTOM,
-            word_count=len(doc.content.split()),
-            language="en"
-        )
-        
-        # Create processed chunk  
-        chunk_metadata = ChunkMetadata(
-            chunk_id=str(uuid4()),
-            document_id="",  # Will be set by storage
-            chunk_index=0,
-            start_char=0,
-            end_char=len(doc.content),
-            page_number=1
-        )
-        
-        processed_chunk = ProcessedChunk(
-            chunk_id=chunk_metadata.chunk_id,
-            content=doc.content,
-            metadata=chunk_metadata,
-            embeddings=embeddings,
-            token_count=len(doc.content.split()),
-            language="en"
-        )
-        
-        # Store document across all databases
-        logger.info(f"🔄 STEP 4: About to store document '{doc.title}' in storage service")
-        try:
-            document_id = await storage.store_document(
-                ingestion_request,
-                document_metadata,
-                [processed_chunk]
-            )
-            logger.info(f"✅ STEP 5: Document '{doc.title}' stored successfully with ID: {document_id}")
-        except Exception as storage_error:
-            logger.error(f"❌ STEP 5 FAILED: Storage error for '{doc.title}': {storage_error}")
-            import traceback
-            logger.error(f"Storage traceback: {traceback.format_exc()}")
-            raise
-        
-    except Exception as e:
-        logger.error(f"Document processing failed: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application with REAL database connections"""
@@ -2358,6 +2401,14 @@ async def startup_event():
     # Initialize ALL database connections
     db_results = await db_manager.initialize_all()
     
+    # Bring databases created from an older init.sql up to the current schema
+    if db_results.get("postgres"):
+        try:
+            async with db_manager.get_postgres_connection() as conn:
+                await apply_schema_migrations(conn)
+        except Exception as e:
+            logger.error(f"❌ Schema migration failed: {e}")
+    
     # Initialize automatic document processing pipeline
     try:
         from app.core import processing_pipeline
@@ -2420,6 +2471,10 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"Error stopping background processor: {e}")
     
+    # Close the shared Ollama HTTP client and the embedding cache
+    await ollama_client.aclose()
+    await embedding_cache.close()
+    
     # Close database connections
     await db_manager.close_all()
     logger.info("🔒 Database connections closed")
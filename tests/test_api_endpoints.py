@@ -0,0 +1,170 @@
+"""Tests for diary API endpoints that can run without live backends.
+
+``/health`` reuses its result for ``HEALTH_CACHE_TTL`` seconds but never
+caches a failed probe. ``/api/embeddings`` accepts a string or a list of
+strings and shapes its response accordingly. Ollama and the databases are
+replaced with in-process fakes.
+
+The tests require the diary API's dependencies; if ``main`` cannot be
+imported, all tests in this file will be skipped.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from typing import Any, Dict, List
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "services", "diary-api"))
+# main refuses to start in production without a session secret
+os.environ.setdefault("ENV", "development")
+
+try:  # pragma: no cover - import failure handled via pytest skip
+    from fastapi.testclient import TestClient
+    import main
+    API_AVAILABLE = True
+except BaseException:  # ModuleNotFoundError is the common case; main may also sys.exit
+    TestClient = main = None  # type: ignore
+    API_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(not API_AVAILABLE, reason="diary API dependencies not available")
+
+
+DB_HEALTH = {
+    "postgres": True,
+    "neo4j": True,
+    "qdrant": True,
+    "redis": True,
+    "details": {},
+}
+
+
+@pytest.fixture
+def client() -> TestClient:
+    """A client whose Host header passes the trusted-host middleware."""
+
+    return TestClient(main.app, base_url="http://localhost")
+
+
+@pytest.fixture
+def probes(monkeypatch: pytest.MonkeyPatch) -> Dict[str, Any]:
+    """Fake health probes that count calls and can be made to fail."""
+
+    state: Dict[str, Any] = {"calls": 0, "fail": False}
+
+    async def ollama_health() -> bool:
+        state["calls"] += 1
+        return True
+
+    async def db_health() -> Dict[str, Any]:
+        if state["fail"]:
+            raise RuntimeError("postgres unreachable")
+        return DB_HEALTH
+
+    monkeypatch.setattr(main.ollama_client, "health_check", ollama_health)
+    monkeypatch.setattr(main.db_manager, "health_check", db_health)
+    monkeypatch.setattr(main, "_health_cache", {"ts": 0.0, "data": None})
+    monkeypatch.setattr(main, "HEALTH_CACHE_TTL", 60.0)
+    return state
+
+
+@pytest.fixture
+def embedder(monkeypatch: pytest.MonkeyPatch) -> List[List[str]]:
+    """Fake Ollama embeddings, three dimensions per text; records each batch."""
+
+    batches: List[List[str]] = []
+
+    async def embed(texts: List[str]) -> List[List[float]]:
+        batches.append(list(texts))
+        return [[float(len(text)), 0.5, -0.5] for text in texts]
+
+    monkeypatch.setattr(main.ollama_client, "get_embeddings_cached", embed)
+    monkeypatch.setattr(main.ollama_client, "get_embeddings_batch", embed)
+    return batches
+
+
+# ---------------------------------------------------------------------------
+# /health
+# ---------------------------------------------------------------------------
+
+def test_health_reuses_a_recent_result(client: TestClient, probes: Dict[str, Any]) -> None:
+    first = client.get("/health")
+    second = client.get("/health")
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert first.json()["services"]["postgres"] == "up"
+    assert probes["calls"] == 1
+
+
+def test_health_probes_again_once_the_ttl_expires(
+    client: TestClient, probes: Dict[str, Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(main, "HEALTH_CACHE_TTL", 0.0)
+
+    client.get("/health")
+    client.get("/health")
+
+    assert probes["calls"] == 2
+
+
+def test_health_does_not_cache_a_failed_probe(client: TestClient, probes: Dict[str, Any]) -> None:
+    probes["fail"] = True
+    assert client.get("/health").status_code == 503
+
+    probes["fail"] = False
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "healthy"
+    assert probes["calls"] == 2
+
+
+# ---------------------------------------------------------------------------
+# /api/embeddings
+# ---------------------------------------------------------------------------
+
+def test_embeddings_for_a_string_is_a_single_vector(client: TestClient, embedder: List[List[str]]) -> None:
+    response = client.post("/api/embeddings", json={"text": "hello"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["embeddings"] == [5.0, 0.5, -0.5]
+    assert body["dimensions"] == 3
+    assert body["text_length"] == 5
+    assert "count" not in body
+    assert embedder == [["hello"]]
+
+
+def test_embeddings_for_a_list_is_one_vector_per_text(client: TestClient, embedder: List[List[str]]) -> None:
+    response = client.post("/api/embeddings", json={"text": ["a", "bcd"]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["embeddings"] == [[1.0, 0.5, -0.5], [3.0, 0.5, -0.5]]
+    assert body["count"] == 2
+    assert body["dimensions"] == 3
+    assert body["text_length"] == 4
+    assert embedder == [["a", "bcd"]]
+
+
+def test_embeddings_rejects_an_empty_list(client: TestClient, embedder: List[List[str]]) -> None:
+    response = client.post("/api/embeddings", json={"text": []})
+
+    assert response.status_code == 400
+    assert embedder == []
+
+
+def test_embeddings_list_with_a_failed_text_is_unavailable(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def partial(texts: List[str]) -> List[List[float]]:
+        return [[1.0, 2.0], []]
+
+    monkeypatch.setattr(main.ollama_client, "get_embeddings_cached", partial)
+
+    response = client.post("/api/embeddings", json={"text": ["ok", "failed"]})
+
+    assert response.status_code == 503
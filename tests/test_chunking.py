@@ -0,0 +1,68 @@
+"""Tests for the document chunker used by ``/api/docs/ingest``.
+
+``chunk_text`` splits content into overlapping word windows and records the
+character offsets of each chunk in the original text.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "services", "diary-api"))
+
+from app.services.chunking import chunk_text  # noqa: E402
+
+
+def _words(count: int) -> str:
+    return " ".join(f"w{i}" for i in range(count))
+
+
+def test_empty_and_whitespace_input_yield_no_chunks() -> None:
+    assert chunk_text("") == []
+    assert chunk_text("  \n\t ") == []
+
+
+def test_input_shorter_than_one_window_is_a_single_chunk() -> None:
+    content = "  alpha beta\ngamma  "
+    chunks = chunk_text(content, max_tokens=10, overlap=2)
+
+    assert len(chunks) == 1
+    assert chunks[0]["content"] == "alpha beta\ngamma"
+    assert chunks[0]["start_char"] == 2
+    assert chunks[0]["end_char"] == len(content) - 2
+    assert chunks[0]["token_count"] == 3
+
+
+def test_consecutive_chunks_share_overlap_words() -> None:
+    chunks = chunk_text(_words(25), max_tokens=10, overlap=3)
+
+    assert [chunk["token_count"] for chunk in chunks] == [10, 10, 10, 4]
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous["content"].split()[-3:] == current["content"].split()[:3]
+
+
+def test_offsets_point_back_into_the_original_content() -> None:
+    content = _words(40).replace(" ", "  \n", 5)
+    chunks = chunk_text(content, max_tokens=8, overlap=2)
+
+    for chunk in chunks:
+        assert content[chunk["start_char"]:chunk["end_char"]] == chunk["content"]
+    assert chunks[0]["start_char"] == 0
+    assert chunks[-1]["end_char"] == len(content)
+
+
+def test_every_word_is_covered() -> None:
+    content = _words(100)
+    chunks = chunk_text(content, max_tokens=16, overlap=4)
+
+    covered = set()
+    for chunk in chunks:
+        covered.update(chunk["content"].split())
+    assert covered == set(content.split())
+
+
+def test_overlap_not_smaller_than_window_still_advances() -> None:
+    chunks = chunk_text(_words(5), max_tokens=2, overlap=2)
+
+    assert [chunk["content"] for chunk in chunks] == ["w0 w1", "w1 w2", "w2 w3", "w3 w4"]
@@ -0,0 +1,56 @@
+"""Tests for the pure helpers in the session-to-document pipeline.
+
+``_truncate_for_embedding`` fits text to the embedding model's context by
+keeping its head and tail joined with a newline.
+
+The tests require the pipeline's dependencies; if ``fix_automatic_pipeline``
+cannot be imported, all tests in this file will be skipped.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "services", "diary-api"))
+
+try:  # pragma: no cover - import failure handled via pytest skip
+    from fix_automatic_pipeline import (
+        EMBED_HEAD_CHARS,
+        EMBED_TAIL_CHARS,
+        MAX_EMBED_CHARS,
+        _truncate_for_embedding,
+    )
+    PIPELINE_AVAILABLE = True
+except Exception:  # ModuleNotFoundError is the common case
+    _truncate_for_embedding = None  # type: ignore
+    EMBED_HEAD_CHARS = EMBED_TAIL_CHARS = MAX_EMBED_CHARS = 0
+    PIPELINE_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not PIPELINE_AVAILABLE, reason="fix_automatic_pipeline dependencies not available"
+)
+
+
+def test_text_within_the_budget_is_unchanged() -> None:
+    assert _truncate_for_embedding("") == ""
+    content = "x" * MAX_EMBED_CHARS
+    assert _truncate_for_embedding(content) is content
+
+
+def test_long_text_keeps_head_and_tail_within_the_budget() -> None:
+    content = "".join(chr(ord("a") + i % 26) for i in range(MAX_EMBED_CHARS * 3))
+    truncated = _truncate_for_embedding(content)
+
+    assert len(truncated) == MAX_EMBED_CHARS
+    assert truncated == content[:EMBED_HEAD_CHARS] + "\n" + content[-EMBED_TAIL_CHARS:]
+
+
+def test_one_char_over_the_budget_is_truncated() -> None:
+    content = "y" * (MAX_EMBED_CHARS + 1)
+    truncated = _truncate_for_embedding(content)
+
+    assert len(truncated) == MAX_EMBED_CHARS
+    assert truncated[EMBED_HEAD_CHARS] == "\n"
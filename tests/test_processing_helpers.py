@@ -0,0 +1,81 @@
+"""Tests for the pure helpers in the automatic document processing pipeline.
+
+``_parse_json_array`` pulls the first JSON array out of a chat model's
+response, which often wraps it in prose or code fences. ``_content_views``
+slices a document once into the prefixes each pipeline stage uses.
+
+The tests require the pipeline's dependencies; if ``fix_automatic_processing``
+cannot be imported, all tests in this file will be skipped.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "services", "diary-api"))
+
+try:  # pragma: no cover - import failure handled via pytest skip
+    from fix_automatic_processing import _content_views, _parse_json_array
+    PIPELINE_AVAILABLE = True
+except Exception:  # ModuleNotFoundError is the common case
+    _content_views = _parse_json_array = None  # type: ignore
+    PIPELINE_AVAILABLE = False
+
+pytestmark = pytest.mark.skipif(
+    not PIPELINE_AVAILABLE, reason="fix_automatic_processing dependencies not available"
+)
+
+
+def test_parse_json_array_ignores_surrounding_prose() -> None:
+    text = 'Here are the entities:\n[{"name": "Redis", "type": "TECH"}]\nHope this helps.'
+
+    assert _parse_json_array(text) == [{"name": "Redis", "type": "TECH"}]
+
+
+def test_parse_json_array_stops_at_the_array_end_despite_trailing_brackets() -> None:
+    text = '[{"name": "FastAPI"}] Note: see [1] and [2] for details]'
+
+    assert _parse_json_array(text) == [{"name": "FastAPI"}]
+
+
+def test_parse_json_array_skips_brackets_that_are_not_json() -> None:
+    text = 'Entities [from the text]: ["Neo4j", "Qdrant"]'
+
+    assert _parse_json_array(text) == ["Neo4j", "Qdrant"]
+
+
+def test_parse_json_array_keeps_nested_arrays() -> None:
+    text = 'Result: [["a", "b"], [1, [2, 3]]] done'
+
+    assert _parse_json_array(text) == [["a", "b"], [1, [2, 3]]]
+
+
+def test_parse_json_array_returns_none_without_an_array() -> None:
+    assert _parse_json_array("") is None
+    assert _parse_json_array("No entities found.") is None
+    assert _parse_json_array('{"name": "Redis"}') is None
+    assert _parse_json_array("[unterminated") is None
+
+
+VIEW_LENGTHS = {"ner": 3000, "relations": 2000, "embed": 8000, "graph": 500, "payload": 1000}
+
+
+def test_content_views_are_prefixes_of_the_stage_lengths() -> None:
+    content = "".join(chr(ord("a") + i % 26) for i in range(10_000))
+    views = _content_views(content)
+
+    assert set(views) == set(VIEW_LENGTHS)
+    for name, length in VIEW_LENGTHS.items():
+        assert views[name] == content[:length]
+        assert len(views[name]) == length
+
+
+def test_content_views_of_short_content_are_the_whole_content() -> None:
+    content = "short document"
+    views = _content_views(content)
+
+    assert all(view == content for view in views.values())
+    assert _content_views("") == {name: "" for name in VIEW_LENGTHS}